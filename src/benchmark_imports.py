@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+
+""" This script measures the import time of the map tooling modules.
+
+Every module is imported in a fresh interpreter, as it would be by a short
+lived batch worker, and the modules pulled in that are not needed for map
+generation are reported.
+"""
+
+MODULES = [
+    'numpy',
+    'mapping.spline',
+    'mapping.map_generator',
+    'mapping.map_io',
+    'mapping.raster',
+    'mapping.intersection',
+]
+
+HEAVY_MODULES = ['matplotlib', 'scipy', 'pygame', 'OpenGL']
+
+IMPORT_SNIPPET = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'elapsed': elapsed, 'heavy': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def time_import(module, repeat):
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    snippet = IMPORT_SNIPPET.format(module=module, heavy=HEAVY_MODULES)
+
+    elapsed, heavy = [], []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', snippet], cwd=src_dir, check=True,
+                                stdout=subprocess.PIPE, universal_newlines=True).stdout
+        result = json.loads(output)
+        elapsed.append(result['elapsed'])
+        heavy = result['heavy']
+
+    return elapsed, heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the import time of the map tooling.")
+    parser.add_argument('modules', nargs='*', default=MODULES)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    print("{:<28} {:>10} {:>10}  {}".format('module', 'median ms', 'max ms', 'heavy imports'))
+    for module in args.modules:
+        elapsed, heavy = time_import(module, args.repeat)
+        print("{:<28} {:>10.1f} {:>10.1f}  {}".format(
+            module, 1000.0 * np.median(elapsed), 1000.0 * np.max(elapsed), ', '.join(heavy) or '-'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+from mapping.map_generator import MapGenerator
+from mapping.spline_backends import SPLINE_BACKENDS
+from mapping.spline_cache import SplineCache
+
+
+""" This script compares the throughput of the spline interpolation backends
+on the cell paths of randomly generated maps.
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the spline interpolation backends.")
+    parser.add_argument('--num-maps', type=int, default=20)
+    parser.add_argument('--num-cells', type=int, default=20)
+    parser.add_argument('--spline-density', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    random.seed(0)
+    np.random.seed(0)
+    map_gen = MapGenerator(-100.0, 100.0, -100.0, 100.0, args.num_cells, args.num_cells, 8, 1.0, args.spline_density)
+    grid_x_ticks, grid_y_ticks = map_gen.grid_ticks
+
+    paths = []
+    for _ in range(args.num_maps):
+        for start_cell, path in map_gen.get_random_paths().paths.items():
+            paths.append(np.array([start_cell] + path))
+    num_knots = sum(len(path) for path in paths)
+    print("{} paths, {} knots, density {}".format(len(paths), num_knots, args.spline_density))
+
+    print("{:<12} {:>10} {:>12}".format('backend', 'best s', 'paths / s'))
+    for name, backend in SPLINE_BACKENDS.items():
+        # Untimed warm-up, so lazy imports such as scipy are not measured
+        SplineCache(maxsize=0).fit(paths[0], grid_x_ticks, grid_y_ticks, args.spline_density, backend)
+
+        timings = []
+        for _ in range(args.repeat):
+            # A cache that keeps nothing, so every path is refitted
+            spline_cache = SplineCache(maxsize=0)
+            start = time.perf_counter()
+            for path in paths:
+                spline_cache.fit(path, grid_x_ticks, grid_y_ticks, args.spline_density, backend)
+            timings.append(time.perf_counter() - start)
+
+        best = min(timings)
+        print("{:<12} {:>10.3f} {:>12.1f}".format(name, best, len(paths) / best))
+
+
+if __name__ == '__main__':
+    main()
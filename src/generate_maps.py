@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+import argparse
+import glob
+import json
+import os
+import random
+from multiprocessing import Pool
+
+import numpy as np
+
+from mapping.map_generator import MapGenerator
+from mapping.map_io import save_map, load_map
+from mapping.map_stats import summarize_path_splines
+from mapping.profiling import StageProfiler
+from mapping.spline_backends import SPLINE_BACKENDS
+
+
+""" This script is used to generate a dataset of maps from a range of seeds.
+
+Every map is written to <out_dir>/shard_<k>/map_<seed>.npz as soon as it is
+finished and a line with its summary statistics is appended to
+<out_dir>/summary.jsonl. Maps that already exist are skipped, so an
+interrupted run is resumed by running the same command again.
+"""
+
+SUMMARY_FILENAME = 'summary.jsonl'
+
+
+def map_filename(out_dir, seed, maps_per_shard):
+    shard_dir = os.path.join(out_dir, 'shard_{:05d}'.format(seed // maps_per_shard))
+    return os.path.join(shard_dir, 'map_{:08d}.npz'.format(seed))
+
+
+def generate_map(job):
+    seed, config, filename, profile = job
+
+    random.seed(seed)
+    np.random.seed(seed)
+
+    profiler = StageProfiler() if profile else None
+    map_gen = MapGenerator(profiler=profiler, **config)
+    random_paths = map_gen.get_random_paths()
+    path_splines = map_gen.get_random_path_splines(random_paths)
+
+    summary = summarize_path_splines(path_splines)
+    summary['seed'] = seed
+    if profiler is not None:
+        profiler.stop()
+        summary['profile'] = profiler.report()
+
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    save_map(filename, path_splines, random_paths, metadata={'seed': seed, 'config': config, 'summary': summary})
+
+    return summary
+
+
+def truncate_partial_line(summary_path):
+    """ Drop a summary line a killed run left without its newline. """
+    if not os.path.exists(summary_path):
+        return
+
+    with open(summary_path, 'rb+') as f:
+        content = f.read()
+        if content and not content.endswith(b'\n'):
+            f.truncate(content.rfind(b'\n') + 1)
+
+
+def remove_partial_maps(out_dir):
+    """ Remove temporary map files of workers that were killed while writing. """
+    for tmp_filename in glob.glob(os.path.join(out_dir, 'shard_*', '*.tmp.npz')):
+        os.remove(tmp_filename)
+
+
+def read_summarized_seeds(summary_path):
+    seeds = set()
+    if not os.path.exists(summary_path):
+        return seeds
+
+    with open(summary_path) as f:
+        for line in f:
+            try:
+                seeds.add(json.loads(line)['seed'])
+            except (ValueError, KeyError):
+                # Partially written line from an interrupted run
+                continue
+    return seeds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a sharded dataset of random maps.")
+    parser.add_argument('out_dir')
+    parser.add_argument('--seed-start', type=int, default=0)
+    parser.add_argument('--num-maps', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--maps-per-shard', type=int, default=1000)
+    parser.add_argument('--max-extent', type=float, default=100.0)
+    parser.add_argument('--num-cells', type=int, default=20)
+    parser.add_argument('--num-connectors', type=int, default=8)
+    parser.add_argument('--connector-radius', type=float, default=1.0)
+    parser.add_argument('--spline-density', type=int, default=200)
+    parser.add_argument('--spline-backend', choices=sorted(SPLINE_BACKENDS), default='reference')
+    parser.add_argument('--profile', action='store_true', help="add per stage timings to the map summaries")
+    args = parser.parse_args()
+
+    config = {
+        'x_min': -args.max_extent,
+        'x_max': args.max_extent,
+        'y_min': -args.max_extent,
+        'y_max': args.max_extent,
+        'num_x_cells': args.num_cells,
+        'num_y_cells': args.num_cells,
+        'num_connectors': args.num_connectors,
+        'connector_radius': args.connector_radius,
+        'spline_density': args.spline_density,
+        'spline_backend': args.spline_backend,
+    }
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    summary_path = os.path.join(args.out_dir, SUMMARY_FILENAME)
+    truncate_partial_line(summary_path)
+    remove_partial_maps(args.out_dir)
+    summarized_seeds = read_summarized_seeds(summary_path)
+
+    pending = []
+    with open(summary_path, 'a') as summary_file:
+        for seed in range(args.seed_start, args.seed_start + args.num_maps):
+            filename = map_filename(args.out_dir, seed, args.maps_per_shard)
+            if not os.path.exists(filename):
+                pending.append((seed, config, filename, args.profile))
+            elif seed not in summarized_seeds:
+                # Map was written but the run stopped before its summary was
+                _, _, metadata = load_map(filename)
+                summary_file.write(json.dumps(metadata['summary']) + '\n')
+
+    print("Generating {} of {} maps with {} workers".format(len(pending), args.num_maps, args.workers))
+
+    with Pool(args.workers) as pool, open(summary_path, 'a') as summary_file:
+        for i, summary in enumerate(pool.imap_unordered(generate_map, pending)):
+            if summary['seed'] not in summarized_seeds:
+                summary_file.write(json.dumps(summary) + '\n')
+                summary_file.flush()
+            print("[{}/{}] seed {}: {} paths".format(i + 1, len(pending), summary['seed'], summary['num_paths']))
+
+
+if __name__ == '__main__':
+    main()
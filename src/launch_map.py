@@ -2,7 +2,6 @@
 
 from mapping.map_generator import MapGenerator 
 from mapping.map_manager import MapManager
-from visualization.map_perspective import MapPerspective
 
 
 """ This script is used to run the map visualizer. """
@@ -25,6 +24,9 @@ if __name__ == '__main__':
 
     path_splines = map_gen.get_random_path_splines()
     map_manager = MapManager(path_splines)
+
+    # Imported here so that importing this module does not load pygame and OpenGL
+    from visualization.map_perspective import MapPerspective
     MapPerspective(map_manager).run()
 
 
@@ -0,0 +1,246 @@
+from collections import namedtuple
+
+import numpy as np
+
+
+SplineIntersection = namedtuple('SplineIntersection', ['spline_a', 's_a', 'spline_b', 's_b', 'x', 'y'])
+
+
+def spline_segments(path_splines):
+    """
+    Flatten every spline polyline into one segment table
+
+    :param path_splines: list of PathSpline
+    :return:
+        - p0         : N x 2 segment start points
+        - p1         : N x 2 segment end points
+        - spline_ids : index of the owning spline in path_splines
+        - seg_ids    : index of the segment within its spline
+        - s0         : arc length at the segment start
+    """
+    p0s, p1s, spline_ids, seg_ids, s0s = [], [], [], [], []
+    for spline_idx, spline in enumerate(path_splines):
+        pts = np.column_stack([np.asarray(spline.x, dtype=float), np.asarray(spline.y, dtype=float)])
+        if len(pts) < 2:
+            continue
+        seg_lens = np.hypot(*np.diff(pts, axis=0).T)
+        p0s.append(pts[:-1])
+        p1s.append(pts[1:])
+        spline_ids.append(np.full(len(seg_lens), spline_idx))
+        seg_ids.append(np.arange(len(seg_lens)))
+        s0s.append(np.concatenate([[0.0], np.cumsum(seg_lens)[:-1]]))
+
+    if not p0s:
+        empty = np.zeros((0, 2))
+        return empty, empty, np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0)
+
+    return (np.concatenate(p0s), np.concatenate(p1s), np.concatenate(spline_ids),
+            np.concatenate(seg_ids), np.concatenate(s0s))
+
+
+# Upper bound on candidate segment pairs tested at once
+MAX_CANDIDATE_PAIRS = 1 << 20
+
+
+def split_long_segments(p0, p1, max_len):
+    """
+    Split segments longer than max_len into equal pieces
+
+    :return:
+        - p0     : start points of the pieces
+        - p1     : end points of the pieces
+        - parent : index of the segment every piece was cut from
+        - t0     : fraction of the parent segment at the piece start
+    """
+    seg_vec = p1 - p0
+    seg_len = np.hypot(seg_vec[:, 0], seg_vec[:, 1])
+    num_pieces = np.maximum(np.ceil(seg_len / max_len), 1).astype(np.int64)
+
+    parent = np.repeat(np.arange(len(p0)), num_pieces)
+    piece = np.arange(num_pieces.sum()) - np.repeat(np.cumsum(num_pieces) - num_pieces, num_pieces)
+    t0 = piece / num_pieces[parent]
+    t1 = (piece + 1) / num_pieces[parent]
+
+    return (p0[parent] + t0[:, None] * seg_vec[parent],
+            p0[parent] + t1[:, None] * seg_vec[parent],
+            parent, t0)
+
+
+def _candidate_pairs(p0, p1, cell_size):
+    """
+    Pairs of segments sharing a grid cell, yielded in batches of about
+    MAX_CANDIDATE_PAIRS. Pieces of one segment and segments spanning several
+    cells make a pair show up more than once.
+    """
+    # Cut long segments so every piece covers at most 2 x 2 cells
+    p0, p1, parent, _ = split_long_segments(p0, p1, cell_size)
+
+    # Bucket piece bounding boxes into a uniform grid
+    lo = np.minimum(p0, p1)
+    hi = np.maximum(p0, p1)
+    origin = lo.min(axis=0)
+    cell_lo = np.floor((lo - origin) / cell_size).astype(np.int64)
+    cell_hi = np.floor((hi - origin) / cell_size).astype(np.int64)
+    span = cell_hi - cell_lo + 1
+    counts = span[:, 0] * span[:, 1]
+
+    # Expand each piece into one entry per covered cell
+    piece_rep = np.repeat(np.arange(len(p0)), counts)
+    local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    cell_x = cell_lo[piece_rep, 0] + local % span[piece_rep, 0]
+    cell_y = cell_lo[piece_rep, 1] + local // span[piece_rep, 0]
+    cell_key = cell_x * (cell_hi[:, 1].max() + 1) + cell_y
+
+    order = np.argsort(cell_key, kind='stable')
+    cell_key = cell_key[order]
+    seg_rep = parent[piece_rep[order]]
+
+    # Pair every entry with the entries following it in the same cell. Only
+    # entries with that many followers stay active, so the total work is
+    # the number of pairs rather than entries times the largest cell.
+    group_start = np.flatnonzero(np.r_[True, cell_key[1:] != cell_key[:-1]])
+    group_size = np.diff(np.r_[group_start, len(cell_key)])
+    group_end = np.repeat(group_start + group_size, group_size)
+
+    firsts, seconds, num_pairs = [], [], 0
+    active = np.arange(len(cell_key))
+    offset = 1
+    while True:
+        active = active[active + offset < group_end[active]]
+        if len(active) == 0:
+            break
+
+        for start in range(0, len(active), MAX_CANDIDATE_PAIRS):
+            batch = active[start:start + MAX_CANDIDATE_PAIRS]
+            firsts.append(seg_rep[batch])
+            seconds.append(seg_rep[batch + offset])
+            num_pairs += len(batch)
+
+            if num_pairs >= MAX_CANDIDATE_PAIRS:
+                yield _ordered_pairs(firsts, seconds)
+                firsts, seconds, num_pairs = [], [], 0
+
+        offset += 1
+
+    if firsts:
+        yield _ordered_pairs(firsts, seconds)
+
+
+def _ordered_pairs(firsts, seconds):
+    a = np.concatenate(firsts)
+    b = np.concatenate(seconds)
+    return np.minimum(a, b), np.maximum(a, b)
+
+
+def find_spline_intersections(path_splines, cell_size=None):
+    """
+    Find all crossings between the polylines of the given path splines
+
+    Segments are bucketed into a uniform grid and only segments sharing a
+    cell are tested against each other.
+
+    :param path_splines: list of PathSpline
+    :param cell_size: grid cell size, defaults to the median segment length
+    :return: list of SplineIntersection, where spline_a/spline_b index into
+        path_splines and s_a/s_b are arc lengths along each spline
+    """
+    p0, p1, spline_ids, seg_ids, s0 = spline_segments(path_splines)
+    if len(p0) < 2:
+        return []
+
+    seg_vec = p1 - p0
+    seg_len = np.hypot(seg_vec[:, 0], seg_vec[:, 1])
+    if cell_size is None:
+        cell_size = max(np.median(seg_len), 1e-9)
+
+    hit_a, hit_b, hit_t, hit_u = [], [], [], []
+    for a, b in _candidate_pairs(p0, p1, cell_size):
+        # Neighbouring segments of the same spline share an endpoint
+        same_spline = spline_ids[a] == spline_ids[b]
+        keep = (a != b) & ~(same_spline & (np.abs(seg_ids[a] - seg_ids[b]) <= 1))
+        a, b = a[keep], b[keep]
+
+        # Solve p + t * r = q + u * w for every candidate pair
+        r = seg_vec[a]
+        w = seg_vec[b]
+        qp = p0[b] - p0[a]
+        denom = r[:, 0] * w[:, 1] - r[:, 1] * w[:, 0]
+        parallel = np.abs(denom) < 1e-12
+        denom = np.where(parallel, 1.0, denom)
+        t = (qp[:, 0] * w[:, 1] - qp[:, 1] * w[:, 0]) / denom
+        u = (qp[:, 0] * r[:, 1] - qp[:, 1] * r[:, 0]) / denom
+
+        # Half-open ranges so a crossing on a shared sample point counts once
+        hit = ~parallel & (t >= 0.0) & (t < 1.0) & (u >= 0.0) & (u < 1.0)
+        hit_a.append(a[hit])
+        hit_b.append(b[hit])
+        hit_t.append(t[hit])
+        hit_u.append(u[hit])
+
+    if not hit_a:
+        return []
+
+    # The same pair can be found in several cells
+    a, b = np.concatenate(hit_a), np.concatenate(hit_b)
+    _, first = np.unique(a * len(p0) + b, return_index=True)
+    a, b = a[first], b[first]
+    t, u = np.concatenate(hit_t)[first], np.concatenate(hit_u)[first]
+
+    points = p0[a] + t[:, None] * seg_vec[a]
+    s_a = s0[a] + t * seg_len[a]
+    s_b = s0[b] + u * seg_len[b]
+
+    return [SplineIntersection(spline_a=int(sa), s_a=float(ta), spline_b=int(sb), s_b=float(tb), x=float(x), y=float(y))
+            for sa, ta, sb, tb, x, y in zip(spline_ids[a], s_a, spline_ids[b], s_b, points[:, 0], points[:, 1])]
+
+
+def test_find_spline_intersections(num_splines=30, num_points=60):
+    print("Spline intersection test")
+    from mapping.map_generator import PathSpline
+    rng = np.random.RandomState(0)
+
+    path_splines = []
+    for i in range(num_splines):
+        walk = np.cumsum(rng.normal(size=(num_points, 2)), axis=0) + rng.uniform(-10, 10, size=2)
+        path_splines.append(PathSpline(start_cell=(i, 0), x=walk[:, 0], y=walk[:, 1]))
+    # One long segment across everything, which used to put every segment in the same cells
+    path_splines.append(PathSpline(start_cell=(num_splines, 0), x=np.array([-300.0, 300.0]), y=np.array([-290.0, 310.0])))
+
+    # Brute force over every segment pair
+    p0, p1, spline_ids, seg_ids, s0 = spline_segments(path_splines)
+    a, b = np.triu_indices(len(p0), k=1)
+    keep = ~((spline_ids[a] == spline_ids[b]) & (np.abs(seg_ids[a] - seg_ids[b]) <= 1))
+    a, b = a[keep], b[keep]
+    r, w, qp = p1[a] - p0[a], p1[b] - p0[b], p0[b] - p0[a]
+    denom = r[:, 0] * w[:, 1] - r[:, 1] * w[:, 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (qp[:, 0] * w[:, 1] - qp[:, 1] * w[:, 0]) / denom
+        u = (qp[:, 0] * r[:, 1] - qp[:, 1] * r[:, 0]) / denom
+    hit = (np.abs(denom) >= 1e-12) & (t >= 0.0) & (t < 1.0) & (u >= 0.0) & (u < 1.0)
+    a, b, t, u = a[hit], b[hit], t[hit], u[hit]
+    seg_len = np.hypot(*(p1 - p0).T)
+    expected = np.column_stack([spline_ids[a], s0[a] + t * seg_len[a], spline_ids[b], s0[b] + u * seg_len[b]])
+    expected = expected[np.lexsort(expected.T[::-1])]
+
+    for cell_size in [None, 0.3, 5.0]:
+        result = find_spline_intersections(path_splines, cell_size=cell_size)
+        found = np.array([(r.spline_a, r.s_a, r.spline_b, r.s_b) for r in result]).reshape(-1, 4)
+        found = found[np.lexsort(found.T[::-1])]
+        assert found.shape == expected.shape, "cell_size {}: found {} crossings, expected {}".format(
+            cell_size, len(found), len(expected))
+        assert np.array_equal(found[:, [0, 2]], expected[:, [0, 2]]), "cell_size {}: wrong splines".format(cell_size)
+        assert np.allclose(found[:, [1, 3]], expected[:, [1, 3]], rtol=0.0, atol=1e-9), \
+            "cell_size {}: wrong arc lengths".format(cell_size)
+
+        # The crossing point lies at s_b on spline_b
+        for r in result:
+            spline = path_splines[r.spline_b]
+            s = np.concatenate([[0.0], np.cumsum(np.hypot(np.diff(spline.x), np.diff(spline.y)))])
+            x, y = np.interp(r.s_b, s, spline.x), np.interp(r.s_b, s, spline.y)
+            assert np.hypot(x - r.x, y - r.y) < 1e-9, "cell_size {}: crossing point is not on spline_b".format(cell_size)
+
+    print("Found all {} crossings".format(len(expected)))
+
+
+if __name__ == '__main__':
+    test_find_spline_intersections()
@@ -1,13 +1,16 @@
 
 import random
 import numpy as np
-import matplotlib.pyplot as plt
 
 from collections import namedtuple 
 
 from mapping.spline import calc_2d_spline_interpolation 
+from mapping.profiling import NULL_PROFILER
+from mapping.raster import rasterize_path_splines
+from mapping.spline_backends import get_spline_backend
 
-PathSpline = namedtuple('PathSpline', ['start_cell', 'x', 'y']) 
+# k is the curvature of the spline fit at every point, None if unknown
+PathSpline = namedtuple('PathSpline', ['start_cell', 'x', 'y', 'k'], defaults=(None,))
 
 class Graph(object):
 
@@ -50,7 +53,7 @@ class Graph(object):
 
 class MapGenerator(object):
 
-    def __init__(self, x_min, x_max, y_min, y_max, num_x_cells, num_y_cells, num_connectors, connector_radius, spline_density):
+    def __init__(self, x_min, x_max, y_min, y_max, num_x_cells, num_y_cells, num_connectors, connector_radius, spline_density, spline_cache=None, spline_backend='reference', profiler=None):
         self.x_min = x_min
         self.x_max = x_max
         self.y_min = y_min
@@ -58,6 +61,9 @@ class MapGenerator(object):
         self.num_x_cells = num_x_cells
         self.num_y_cells = num_y_cells
         self.spline_density = spline_density
+        self.spline_cache = spline_cache
+        self.spline_backend = get_spline_backend(spline_backend)
+        self.profiler = profiler if profiler is not None else NULL_PROFILER
 
         assert num_connectors % 2 == 0, "Connector number must be even"
         self.num_connectors = num_connectors
@@ -97,25 +103,28 @@ class MapGenerator(object):
         return connection_rs[:,0], connection_rs[:,1]
 
     def get_random_paths(self):
-        non_visited_cells = set((x, y) for x in range(self.num_x_cells) for y in range(self.num_y_cells))
-        visit_order = list(non_visited_cells)
-        random.shuffle(visit_order)
+        with self.profiler.stage('get_random_paths'):
+            non_visited_cells = set((x, y) for x in range(self.num_x_cells) for y in range(self.num_y_cells))
+            visit_order = list(non_visited_cells)
+            random.shuffle(visit_order)
 
-        edges = Graph()
+            edges = Graph()
 
-        for start_cell in visit_order:
-            # skip cells which have already been visited
-            if not start_cell in non_visited_cells:
-                continue
+            with self.profiler.stage('random_edge_walks'):
+                for start_cell in visit_order:
+                    # skip cells which have already been visited
+                    if not start_cell in non_visited_cells:
+                        continue
 
-            edges.init_path(start_cell)
+                    edges.init_path(start_cell)
 
-            self.random_edge_walk_(edges, non_visited_cells, start_cell)
-            
-        assert len(non_visited_cells) == 0, "Not all cells were visited!"
+                    self.random_edge_walk_(edges, non_visited_cells, start_cell)
+                
+            assert len(non_visited_cells) == 0, "Not all cells were visited!"
 
-        # Remove short paths
-        self.remove_short_paths_(edges)
+            # Remove short paths
+            with self.profiler.stage('remove_short_paths'):
+                self.remove_short_paths_(edges)
 
         return edges
 
@@ -184,30 +193,41 @@ class MapGenerator(object):
         # start nodes of path j for all j != i
         raise NotImplementedError()
     
-    def get_random_path_splines(self):
-        random_paths = self.get_random_paths()
-        grid_x_ticks, grid_y_ticks = self.grid_ticks
+    def get_random_path_splines(self, random_paths=None):
+        if random_paths is None:
+            random_paths = self.get_random_paths()
 
-        output_splines = []
+        with self.profiler.stage('get_random_path_splines'):
+            grid_x_ticks, grid_y_ticks = self.grid_ticks
 
-        # Plot path splines
-        for start_cell, path in random_paths.paths.items():
-            nd_arr = np.zeros((len(path) + 1, 2))
-            nd_arr[0, :] = np.array(start_cell)
-            nd_arr[1:, :] = np.array(path)
-            nd_xs = nd_arr[:, 0]
-            nd_ys = nd_arr[:, 1]
+            output_splines = []
 
-            nd_xs = [grid_x_ticks[int(x_i)] for x_i in nd_xs]
-            nd_ys = [grid_y_ticks[int(y_i)] for y_i in nd_ys]
+            for start_cell, path in random_paths.paths.items():
+                with self.profiler.stage('path_to_cells'):
+                    nd_arr = np.zeros((len(path) + 1, 2), dtype=int)
+                    nd_arr[0, :] = np.array(start_cell)
+                    nd_arr[1:, :] = np.array(path)
 
-            x, y, yaw, k, travel = calc_2d_spline_interpolation(nd_xs, nd_ys, num=self.spline_density)
+                # Maps the cells to grid ticks and fits the spline
+                with self.profiler.stage('fit_path_spline'):
+                    if self.spline_cache is not None:
+                        x, y, yaw, k, travel = self.spline_cache.fit(nd_arr, grid_x_ticks, grid_y_ticks, self.spline_density, self.spline_backend)
+                    else:
+                        nd_xs = grid_x_ticks[nd_arr[:, 0]]
+                        nd_ys = grid_y_ticks[nd_arr[:, 1]]
+                        x, y, yaw, k, travel = self.spline_backend(nd_xs, nd_ys, num=self.spline_density)
 
-            output_splines.append(PathSpline(start_cell=start_cell, x=x, y=y))
+                output_splines.append(PathSpline(start_cell=start_cell, x=x, y=y, k=k))
 
         return output_splines
 
+    def rasterize(self, path_splines, resolution, **kwargs):
+        return rasterize_path_splines(path_splines, self.x_min, self.x_max, self.y_min, self.y_max, resolution, **kwargs)
+
     def plot(self):
+        # Imported here so generating maps does not load matplotlib
+        import matplotlib.pyplot as plt
+
         anchor_xs, anchor_ys = self.grid_anchors
         connection_xs, connection_ys = self.connection_points
 
@@ -0,0 +1,74 @@
+import json
+import os
+
+import numpy as np
+
+from mapping.map_generator import Graph, PathSpline
+
+
+def save_map(filename, path_splines, graph, metadata=None):
+    """
+    Write the path splines and graph of one map to a .npz file
+
+    Splines and paths are ragged, so they are stored as concatenated point
+    arrays with offsets. The file is written to a temporary name first and
+    renamed, so an existing file is always complete.
+    """
+    spline_lens = [len(spline.x) for spline in path_splines]
+    spline_offsets = np.concatenate([[0], np.cumsum(spline_lens)]).astype(np.int64)
+    spline_x = np.concatenate([np.asarray(spline.x, dtype=float) for spline in path_splines]) if path_splines else np.zeros(0)
+    spline_y = np.concatenate([np.asarray(spline.y, dtype=float) for spline in path_splines]) if path_splines else np.zeros(0)
+    # Curvature is only stored when every spline has it
+    has_k = bool(path_splines) and all(spline.k is not None for spline in path_splines)
+    spline_k = np.concatenate([np.asarray(spline.k, dtype=float) for spline in path_splines]) if has_k else np.zeros(0)
+    spline_start_cells = np.array([spline.start_cell for spline in path_splines], dtype=np.int64).reshape(-1, 2)
+
+    paths = [[start_cell] + path for start_cell, path in graph.paths.items()]
+    path_offsets = np.concatenate([[0], np.cumsum([len(path) for path in paths])]).astype(np.int64)
+    path_cells = np.array([cell for path in paths for cell in path], dtype=np.int64).reshape(-1, 2)
+
+    tmp_filename = filename + '.tmp.npz'
+    np.savez(tmp_filename,
+             spline_offsets=spline_offsets,
+             spline_x=spline_x,
+             spline_y=spline_y,
+             spline_k=spline_k,
+             spline_start_cells=spline_start_cells,
+             path_offsets=path_offsets,
+             path_cells=path_cells,
+             metadata=np.array(json.dumps(metadata or {})))
+    os.replace(tmp_filename, filename)
+
+
+def load_map(filename):
+    """
+    Read a map written by save_map
+
+    :return: path_splines, graph, metadata
+    """
+    with np.load(filename) as data:
+        spline_offsets = data['spline_offsets']
+        path_offsets = data['path_offsets']
+        # Maps written before curvature was stored have no spline_k
+        spline_k = data['spline_k'] if 'spline_k' in data.files else np.zeros(0)
+        has_k = len(spline_k) == len(data['spline_x'])
+
+        path_splines = []
+        for i, start_cell in enumerate(data['spline_start_cells']):
+            points = slice(spline_offsets[i], spline_offsets[i + 1])
+            path_splines.append(PathSpline(start_cell=tuple(int(c) for c in start_cell),
+                                           x=data['spline_x'][points],
+                                           y=data['spline_y'][points],
+                                           k=spline_k[points] if has_k else None))
+
+        graph = Graph()
+        path_cells = [tuple(int(c) for c in cell) for cell in data['path_cells']]
+        for i in range(len(path_offsets) - 1):
+            path = path_cells[path_offsets[i]:path_offsets[i + 1]]
+            graph.init_path(path[0])
+            for start_node, end_node in zip(path[:-1], path[1:]):
+                graph.insert(start_node, end_node)
+
+        metadata = json.loads(str(data['metadata']))
+
+    return path_splines, graph, metadata
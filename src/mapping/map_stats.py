@@ -0,0 +1,57 @@
+import numpy as np
+
+
+def distribution(values, percentiles=(5, 50, 95)):
+    """ Summary of a set of values as a JSON friendly dict. """
+    values = np.asarray(values, dtype=float)
+    if len(values) == 0:
+        return {'count': 0}
+
+    summary = {
+        'count': int(len(values)),
+        'min': float(values.min()),
+        'mean': float(values.mean()),
+        'max': float(values.max()),
+    }
+    for p, value in zip(percentiles, np.percentile(values, percentiles)):
+        summary['p{}'.format(p)] = float(value)
+    return summary
+
+
+def path_spline_length(spline):
+    return float(np.hypot(np.diff(spline.x), np.diff(spline.y)).sum())
+
+
+def path_spline_curvature(spline):
+    """
+    Signed curvature at every sample point
+
+    Uses the curvature of the spline fit when the PathSpline has one,
+    otherwise approximates it with finite differences of the sample points.
+    """
+    k = getattr(spline, 'k', None)
+    if k is not None:
+        return np.asarray(k, dtype=float)
+
+    x = np.asarray(spline.x, dtype=float)
+    y = np.asarray(spline.y, dtype=float)
+    if len(x) < 3:
+        return np.zeros(len(x))
+
+    dx, dy = np.gradient(x), np.gradient(y)
+    ddx, ddy = np.gradient(dx), np.gradient(dy)
+    speed_sq = np.maximum(dx ** 2 + dy ** 2, 1e-18)
+    return (dx * ddy - dy * ddx) / speed_sq ** 1.5
+
+
+def summarize_path_splines(path_splines):
+    """ Path count, length and absolute curvature distributions of a map. """
+    lengths = [path_spline_length(spline) for spline in path_splines]
+    curvatures = np.concatenate([np.abs(path_spline_curvature(spline)) for spline in path_splines]) \
+        if path_splines else np.zeros(0)
+
+    return {
+        'num_paths': len(path_splines),
+        'length': distribution(lengths),
+        'curvature': distribution(curvatures),
+    }
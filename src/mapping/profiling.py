@@ -0,0 +1,144 @@
+import json
+import time
+import tracemalloc
+
+from mapping.map_stats import distribution
+
+
+# tracemalloc.reset_peak is only available from Python 3.9
+_HAS_RESET_PEAK = hasattr(tracemalloc, 'reset_peak')
+
+
+class _NullStage(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class NullProfiler(object):
+    """ Profiler that records nothing, used when profiling is disabled. """
+
+    enabled = False
+
+    def stage(self, name):
+        return _NULL_STAGE
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class _Stage(object):
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler._enter(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler._exit(self)
+        return False
+
+
+class StageProfiler(object):
+    """
+    Records wall time, call count and peak allocations of named stages
+
+    Stages may be nested. Peak allocations come from tracemalloc and are
+    relative to the memory allocated when the stage was entered. Before
+    Python 3.9 tracemalloc cannot reset its peak, so only the memory traced
+    at the start and end of every stage and its nested stages is compared.
+
+    :param trace_memory: track peak allocations with tracemalloc, which is
+        started on the first stage if it is not already running
+    :param sink: optional callable(name, elapsed, peak_bytes) called at the
+        end of every stage
+    """
+
+    enabled = True
+
+    def __init__(self, trace_memory=True, sink=None):
+        self.trace_memory = trace_memory
+        self.sink = sink
+        self.durations = {}
+        self.peak_bytes = {}
+        self._stack = []
+        self._started_tracemalloc = False
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def _enter(self, stage):
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracemalloc = True
+
+            current, peak = tracemalloc.get_traced_memory()
+            if not _HAS_RESET_PEAK:
+                peak = current
+            if self._stack:
+                parent = self._stack[-1]
+                parent.peak_seen = max(parent.peak_seen, peak)
+            if _HAS_RESET_PEAK:
+                tracemalloc.reset_peak()
+            stage.start_bytes = current
+            stage.peak_seen = current
+
+        self._stack.append(stage)
+        stage.start_time = time.perf_counter()
+
+    def _exit(self, stage):
+        elapsed = time.perf_counter() - stage.start_time
+        self._stack.pop()
+
+        peak_bytes = 0
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if not _HAS_RESET_PEAK:
+                peak = current
+            stage.peak_seen = max(stage.peak_seen, peak)
+            peak_bytes = stage.peak_seen - stage.start_bytes
+            if self._stack:
+                parent = self._stack[-1]
+                parent.peak_seen = max(parent.peak_seen, stage.peak_seen)
+
+        self.durations.setdefault(stage.name, []).append(elapsed)
+        self.peak_bytes[stage.name] = max(self.peak_bytes.get(stage.name, 0), peak_bytes)
+
+        if self.sink is not None:
+            self.sink(stage.name, elapsed, peak_bytes)
+
+    def stop(self):
+        """ Stop tracemalloc if this profiler started it. """
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def reset(self):
+        self.durations.clear()
+        self.peak_bytes.clear()
+
+    def report(self):
+        """ Per stage call count, total time, peak bytes and time distribution. """
+        stages = {}
+        for name, durations in self.durations.items():
+            stages[name] = {
+                'calls': len(durations),
+                'total_s': float(sum(durations)),
+                'peak_bytes': int(self.peak_bytes[name]) if self.trace_memory else None,
+                'duration_s': distribution(durations),
+            }
+        return {'stages': stages}
+
+    def write_report(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.report(), f, indent=2)
@@ -0,0 +1,218 @@
+import math
+
+import numpy as np
+
+from mapping.intersection import spline_segments, split_long_segments
+
+
+# Upper bound on (segment, cell) entries evaluated at once
+MAX_CHUNK_CELLS = 1 << 22
+
+# ufunc.at became fast in NumPy 1.25, before that sorting is much faster
+_HAS_FAST_UFUNC_AT = tuple(int(v) for v in np.__version__.split('.')[:2]) >= (1, 25)
+
+
+def raster_shape(x_min, x_max, y_min, y_max, resolution):
+    num_cols = int(math.ceil((x_max - x_min) / resolution))
+    num_rows = int(math.ceil((y_max - y_min) / resolution))
+    return num_rows, num_cols
+
+
+def _scatter_minimum(dist, idx, values):
+    """ dist[idx] = min(dist[idx], values) with repeated indices. """
+    if _HAS_FAST_UFUNC_AT:
+        np.minimum.at(dist, idx, values)
+        return
+
+    if len(idx) == 0:
+        return
+    order = np.argsort(idx)
+    idx = idx[order]
+    starts = np.flatnonzero(np.r_[True, idx[1:] != idx[:-1]])
+    cells = idx[starts]
+    dist[cells] = np.minimum(dist[cells], np.minimum.reduceat(values[order], starts))
+
+
+def _rasterize_tile(p0, p1, x_min, y_min, resolution, row_start, col_start, tile_rows, tile_cols, reach):
+    """
+    Distance from every cell center of a tile to the nearest segment, only
+    evaluated within reach of a segment and infinite elsewhere.
+    """
+    dist = np.full(tile_rows * tile_cols, np.inf, dtype=np.float64)
+
+    # Keep only segments whose padded bounding box touches the tile
+    lo = np.minimum(p0, p1) - reach
+    hi = np.maximum(p0, p1) + reach
+    col_lo = np.ceil((lo[:, 0] - x_min) / resolution - 0.5).astype(np.int64) - col_start
+    col_hi = np.floor((hi[:, 0] - x_min) / resolution - 0.5).astype(np.int64) - col_start
+    row_lo = np.ceil((lo[:, 1] - y_min) / resolution - 0.5).astype(np.int64) - row_start
+    row_hi = np.floor((hi[:, 1] - y_min) / resolution - 0.5).astype(np.int64) - row_start
+    col_lo, col_hi = np.maximum(col_lo, 0), np.minimum(col_hi, tile_cols - 1)
+    row_lo, row_hi = np.maximum(row_lo, 0), np.minimum(row_hi, tile_rows - 1)
+
+    inside = (col_lo <= col_hi) & (row_lo <= row_hi)
+    if not inside.any():
+        return dist.reshape(tile_rows, tile_cols)
+
+    p0, p1 = p0[inside], p1[inside]
+    col_lo, col_hi, row_lo, row_hi = col_lo[inside], col_hi[inside], row_lo[inside], row_hi[inside]
+
+    seg_vec = p1 - p0
+    seg_len_sq = np.maximum(np.einsum('ij,ij->i', seg_vec, seg_vec), 1e-18)
+
+    # Every segment is evaluated over a window of the same size so that the
+    # distances can be computed by broadcasting. Segments were cut to about
+    # the median length, so the window fits most of them closely.
+    window_cols = np.arange((col_hi - col_lo).max() + 1)
+    window_rows = np.arange((row_hi - row_lo).max() + 1)
+    chunk_size = max(1, MAX_CHUNK_CELLS // (len(window_cols) * len(window_rows)))
+
+    for start in range(0, len(p0), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        cols = col_lo[chunk, None, None] + window_cols[None, None, :]
+        rows = row_lo[chunk, None, None] + window_rows[None, :, None]
+
+        # Point to segment distance for every window cell center
+        dx = x_min + (col_start + cols + 0.5) * resolution - p0[chunk, 0, None, None]
+        dy = y_min + (row_start + rows + 0.5) * resolution - p0[chunk, 1, None, None]
+        vx = seg_vec[chunk, 0, None, None]
+        vy = seg_vec[chunk, 1, None, None]
+        t = np.clip((dx * vx + dy * vy) / seg_len_sq[chunk, None, None], 0.0, 1.0)
+        d = np.hypot(dx - t * vx, dy - t * vy)
+
+        valid = (cols <= col_hi[chunk, None, None]) & (rows <= row_hi[chunk, None, None])
+        _scatter_minimum(dist, (rows * tile_cols + cols)[valid], d[valid])
+
+    return dist.reshape(tile_rows, tile_cols)
+
+
+def iter_raster_tiles(path_splines, x_min, x_max, y_min, y_max, resolution, road_width=3.0,
+                      mode='occupancy', max_distance=None, tile_size=1024):
+    """
+    Rasterize path spline centerlines tile by tile
+
+    Row i of the grid covers y_min + i * resolution, column j covers
+    x_min + j * resolution.
+
+    :param path_splines: list of PathSpline
+    :param resolution: cell edge length
+    :param road_width: full road width around the centerline
+    :param mode: 'occupancy' yields uint8 drivable cells, 'distance' yields
+        float32 distance to the road edge (0 on the road)
+    :param max_distance: cap of the distance grid, defaults to road_width
+    :param tile_size: tile edge length in cells
+    :return: generator of (row_slice, col_slice, tile)
+    """
+    assert mode in ('occupancy', 'distance'), "Unknown raster mode: {}".format(mode)
+
+    half_width = 0.5 * road_width
+    if max_distance is None:
+        max_distance = road_width
+    reach = half_width if mode == 'occupancy' else half_width + max_distance
+
+    num_rows, num_cols = raster_shape(x_min, x_max, y_min, y_max, resolution)
+    p0, p1, _, _, _ = spline_segments(path_splines)
+
+    # Cut long segments so they do not widen the shared window of every tile,
+    # the distance to the pieces is the distance to the segment
+    if len(p0):
+        seg_len = np.hypot(*(p1 - p0).T)
+        p0, p1, _, _ = split_long_segments(p0, p1, max(np.median(seg_len), resolution))
+
+    for row_start in range(0, num_rows, tile_size):
+        tile_rows = min(tile_size, num_rows - row_start)
+        for col_start in range(0, num_cols, tile_size):
+            tile_cols = min(tile_size, num_cols - col_start)
+            dist = _rasterize_tile(p0, p1, x_min, y_min, resolution, row_start, col_start, tile_rows, tile_cols, reach)
+
+            if mode == 'occupancy':
+                tile = (dist <= half_width).astype(np.uint8)
+            else:
+                tile = np.minimum(np.maximum(dist - half_width, 0.0), max_distance).astype(np.float32)
+
+            yield slice(row_start, row_start + tile_rows), slice(col_start, col_start + tile_cols), tile
+
+
+def rasterize_path_splines(path_splines, x_min, x_max, y_min, y_max, resolution, road_width=3.0,
+                           mode='occupancy', max_distance=None, tile_size=1024, out=None, out_path=None):
+    """
+    Rasterize path spline centerlines into a single grid
+
+    :param out: optional preallocated array of raster_shape(...) to fill
+    :param out_path: optional .npy path, the grid is written through a
+        memory-mapped array instead of being held in memory
+    :return: the filled grid (a np.memmap when out_path is given)
+
+    See iter_raster_tiles for the remaining parameters.
+    """
+    shape = raster_shape(x_min, x_max, y_min, y_max, resolution)
+    dtype = np.uint8 if mode == 'occupancy' else np.float32
+
+    if out is None:
+        if out_path is not None:
+            out = np.lib.format.open_memmap(out_path, mode='w+', dtype=dtype, shape=shape)
+        else:
+            out = np.empty(shape, dtype=dtype)
+    assert out.shape == shape, "Output shape {} does not match raster shape {}".format(out.shape, shape)
+
+    for rows, cols, tile in iter_raster_tiles(path_splines, x_min, x_max, y_min, y_max, resolution, road_width,
+                                              mode, max_distance, tile_size):
+        out[rows, cols] = tile
+
+    if isinstance(out, np.memmap):
+        out.flush()
+
+    return out
+
+
+def test_rasterize_path_splines(resolution=0.25, road_width=1.0, max_distance=2.0):
+    print("Rasterize path splines test")
+    import os
+    import tempfile
+    from mapping.map_generator import PathSpline
+    rng = np.random.RandomState(0)
+
+    path_splines = []
+    for i in range(5):
+        walk = np.cumsum(rng.normal(scale=0.5, size=(60, 2)), axis=0)
+        path_splines.append(PathSpline(start_cell=(i, 0), x=walk[:, 0], y=walk[:, 1]))
+    # One long segment, which used to widen the window of every segment
+    path_splines.append(PathSpline(start_cell=(5, 0), x=np.array([-40.0, 40.0]), y=np.array([-30.0, 35.0])))
+    extent = (-10.0, 10.0, -8.0, 9.0)
+
+    # Brute force distance from every cell center to every segment
+    num_rows, num_cols = raster_shape(*(extent + (resolution,)))
+    centers_x = extent[0] + (np.arange(num_cols) + 0.5) * resolution
+    centers_y = extent[2] + (np.arange(num_rows) + 0.5) * resolution
+    cx, cy = [c.ravel() for c in np.meshgrid(centers_x, centers_y)]
+    nearest = np.full(len(cx), np.inf)
+    p0, p1, _, _, _ = spline_segments(path_splines)
+    for a, v in zip(p0, p1 - p0):
+        t = np.clip(((cx - a[0]) * v[0] + (cy - a[1]) * v[1]) / max(v.dot(v), 1e-18), 0.0, 1.0)
+        nearest = np.minimum(nearest, np.hypot(cx - a[0] - t * v[0], cy - a[1] - t * v[1]))
+    nearest = nearest.reshape(num_rows, num_cols)
+
+    expected_occupancy = (nearest <= 0.5 * road_width).astype(np.uint8)
+    expected_distance = np.clip(nearest - 0.5 * road_width, 0.0, max_distance)
+
+    # A tile size that does not divide the grid
+    occupancy = rasterize_path_splines(path_splines, *extent, resolution, road_width=road_width, tile_size=7)
+    distance = rasterize_path_splines(path_splines, *extent, resolution, road_width=road_width, mode='distance',
+                                      max_distance=max_distance, tile_size=7)
+    assert np.array_equal(occupancy, expected_occupancy), "Occupancy differs in {} cells".format(
+        np.count_nonzero(occupancy != expected_occupancy))
+    assert np.allclose(distance, expected_distance, atol=1e-5), "Distance differs by up to {}".format(
+        np.abs(distance - expected_distance).max())
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        out_path = os.path.join(tmp_dir, 'occupancy.npy')
+        mapped = rasterize_path_splines(path_splines, *extent, resolution, road_width=road_width, out_path=out_path)
+        assert isinstance(mapped, np.memmap), "Expected a memory-mapped output"
+        del mapped
+        assert np.array_equal(np.load(out_path), expected_occupancy), "Memory-mapped occupancy differs"
+
+    print("Both modes match on {} x {} cells".format(num_rows, num_cols))
+
+
+if __name__ == '__main__':
+    test_rasterize_path_splines()
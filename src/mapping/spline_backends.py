@@ -0,0 +1,137 @@
+"""
+Interchangeable 2d spline interpolation backends
+
+Every backend has the signature of calc_2d_spline_interpolation,
+backend(x, y, num) -> x, y, yaw, k, s, and fits the same natural cubic
+spline over the cumulative chord length of the input points.
+
+"""
+import numpy as np
+
+from mapping.spline import calc_2d_spline_interpolation
+
+
+def _chord_length(x, y):
+    return np.concatenate([[0.0], np.cumsum(np.hypot(np.diff(x), np.diff(y)))])
+
+
+def _path_outputs(r_x, r_y, dx, dy, ddx, ddy):
+    yaw = np.arctan2(dy, dx)
+    k = (ddy * dx - ddx * dy) / (dx ** 2 + dy ** 2) ** 1.5
+    travel = np.concatenate([[0.0], np.cumsum(np.hypot(np.diff(r_x), np.diff(r_y)))])
+    return r_x, r_y, yaw, k, travel
+
+
+def _natural_cubic_coefficients(s, values):
+    """
+    Coefficients of the natural cubic splines through the columns of values
+
+    :param s: N knot positions
+    :param values: N x D knot values
+    :return: a, b, c, d arrays of shape N - 1 x D
+    """
+    n = len(s)
+    h = np.diff(s)
+    slopes = np.diff(values, axis=0) / h[:, None]
+
+    A = np.zeros((n, n))
+    A[0, 0] = 1.0
+    A[n - 1, n - 1] = 1.0
+    i = np.arange(1, n - 1)
+    A[i, i - 1] = h[:-1]
+    A[i, i] = 2.0 * (h[:-1] + h[1:])
+    A[i, i + 1] = h[1:]
+
+    B = np.zeros(values.shape)
+    B[1:-1] = 3.0 * (slopes[1:] - slopes[:-1])
+
+    c = np.linalg.solve(A, B)
+    d = np.diff(c, axis=0) / (3.0 * h[:, None])
+    b = slopes - h[:, None] * (c[1:] + 2.0 * c[:-1]) / 3.0
+
+    return values[:-1], b, c[:-1], d
+
+
+def reference_interpolation(x, y, num=100):
+    """ The original Spline2D implementation, evaluated point by point. """
+    return calc_2d_spline_interpolation(x, y, num=num)
+
+
+def numpy_interpolation(x, y, num=100):
+    """ Natural cubic spline with the fit and evaluation vectorized in NumPy. """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    s = _chord_length(x, y)
+    a, b, c, d = _natural_cubic_coefficients(s, np.column_stack([x, y]))
+
+    t = np.linspace(0, s[-1], num + 1)[:-1]
+    idx = np.clip(np.searchsorted(s, t, side='right') - 1, 0, len(s) - 2)
+    dt = (t - s[idx])[:, None]
+    a, b, c, d = a[idx], b[idx], c[idx], d[idx]
+
+    pos = a + b * dt + c * dt ** 2 + d * dt ** 3
+    vel = b + 2.0 * c * dt + 3.0 * d * dt ** 2
+    acc = 2.0 * c + 6.0 * d * dt
+
+    return _path_outputs(pos[:, 0], pos[:, 1], vel[:, 0], vel[:, 1], acc[:, 0], acc[:, 1])
+
+
+def scipy_interpolation(x, y, num=100):
+    """ Natural cubic spline fitted and evaluated by scipy's CubicSpline. """
+    # Imported here so the other backends do not load scipy
+    from scipy.interpolate import CubicSpline
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    s = _chord_length(x, y)
+    spline = CubicSpline(s, np.column_stack([x, y]), bc_type='natural')
+
+    t = np.linspace(0, s[-1], num + 1)[:-1]
+    pos = spline(t)
+    vel = spline(t, 1)
+    acc = spline(t, 2)
+
+    return _path_outputs(pos[:, 0], pos[:, 1], vel[:, 0], vel[:, 1], acc[:, 0], acc[:, 1])
+
+
+SPLINE_BACKENDS = {
+    'reference': reference_interpolation,
+    'numpy': numpy_interpolation,
+    'scipy': scipy_interpolation,
+}
+
+
+def get_spline_backend(backend):
+    """ Look up a backend by name, callables are returned unchanged. """
+    if callable(backend):
+        return backend
+    assert backend in SPLINE_BACKENDS, "Unknown spline backend: {}".format(backend)
+    return SPLINE_BACKENDS[backend]
+
+
+def test_backend_equivalence(num_paths=50, num=200, atol=1e-6):
+    print("Spline backend equivalence test")
+    rng = np.random.RandomState(0)
+
+    for _ in range(num_paths):
+        # Random 8-neighbour walk like the ones produced by MapGenerator
+        steps = rng.randint(-1, 2, size=(rng.randint(2, 40), 2))
+        steps[np.all(steps == 0, axis=1)] = (1, 0)
+        cells = np.vstack([[0, 0], np.cumsum(steps, axis=0)]) * 10.0
+
+        expected = [np.asarray(arr) for arr in reference_interpolation(cells[:, 0], cells[:, 1], num=num)]
+        for name, backend in SPLINE_BACKENDS.items():
+            result = backend(cells[:, 0], cells[:, 1], num=num)
+            for label, exp, res in zip(['x', 'y', 'yaw', 'k', 's'], expected, result):
+                if label == 'yaw':
+                    err = np.abs(np.angle(np.exp(1j * (np.asarray(res) - exp))))
+                else:
+                    err = np.abs(np.asarray(res) - exp)
+                assert np.all(err <= atol * np.maximum(1.0, np.abs(exp))), \
+                    "{} backend differs in {}: max error {}".format(name, label, err.max())
+
+    print("All backends agree")
+
+
+if __name__ == '__main__':
+    test_backend_equivalence()
@@ -0,0 +1,78 @@
+from collections import namedtuple, OrderedDict
+
+import numpy as np
+
+from mapping.spline import calc_2d_spline_interpolation
+
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+class SplineCache(object):
+    """
+    Bounded LRU cache of spline fits for cell paths
+
+    Paths are keyed on their translation-normalized step sequence, the grid
+    spacing, the spline density and the spline backend, so two paths with the same shape share
+    one fit which is offset to the start of each path. Pass the same cache
+    to several MapGenerators to share fits between them.
+
+    Random map paths are long walks with about 8 * 3^14 possible shapes, so
+    they rarely repeat and the cache only pays off for repetitive inputs.
+    """
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._fits = OrderedDict()
+
+    def cache_info(self):
+        return CacheInfo(hits=self.hits, misses=self.misses, maxsize=self.maxsize, currsize=len(self._fits))
+
+    def clear(self):
+        self._fits.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def fit(self, cells, grid_x_ticks, grid_y_ticks, num, interpolate=calc_2d_spline_interpolation):
+        """
+        Calc the 2d spline through a path of grid cells
+
+        :param cells: N x 2 array of (x, y) cell indices
+        :param grid_x_ticks: x coordinate of every cell index
+        :param grid_y_ticks: y coordinate of every cell index
+        :param num: number of path points
+        :param interpolate: spline backend, see mapping.spline_backends
+        :return: x, y, yaw, k, travel as in calc_2d_spline_interpolation,
+            yaw, k and travel are read-only arrays shared between hits
+        """
+        cells = np.asarray(cells, dtype=np.int64)
+        steps = np.diff(cells, axis=0)
+        spacing_x = float(grid_x_ticks[1] - grid_x_ticks[0])
+        spacing_y = float(grid_y_ticks[1] - grid_y_ticks[0])
+        key = (steps.astype(np.int8).tobytes(), spacing_x, spacing_y, num, interpolate)
+
+        fit = self._fits.get(key)
+        if fit is not None:
+            self.hits += 1
+            self._fits.move_to_end(key)
+        else:
+            self.misses += 1
+            local_xs = np.concatenate([[0.0], np.cumsum(steps[:, 0])]) * spacing_x
+            local_ys = np.concatenate([[0.0], np.cumsum(steps[:, 1])]) * spacing_y
+            fit = tuple(np.asarray(arr, dtype=float) for arr in interpolate(local_xs, local_ys, num=num))
+            for arr in fit:
+                arr.setflags(write=False)
+
+            if self.maxsize > 0:
+                self._fits[key] = fit
+                if len(self._fits) > self.maxsize:
+                    self._fits.popitem(last=False)
+
+        x, y, yaw, k, travel = fit
+        x0 = grid_x_ticks[cells[0, 0]]
+        y0 = grid_y_ticks[cells[0, 1]]
+
+        return x + x0, y + y0, yaw, k, travel
+
@@ -0,0 +1,140 @@
+from collections import namedtuple
+
+import numpy as np
+
+from mapping.intersection import spline_segments, split_long_segments
+
+
+SplineQuery = namedtuple('SplineQuery', ['spline', 's', 'distance', 'x', 'y'])
+
+
+class SplineSegmentIndex(object):
+    """
+    Uniform grid over the segments of a set of path splines
+
+    Every segment is stored in the cell of its midpoint. Segments are sorted
+    by cell so that the segments of one cell are a contiguous range.
+    Segments longer than two cells are split into pieces, so that a few long
+    segments do not widen the search of every query.
+
+    :param path_splines: list of PathSpline
+    :param cell_size: grid cell size, defaults to the median segment length
+    """
+
+    def __init__(self, path_splines, cell_size=None):
+        p0, p1, spline_ids, seg_ids, s0 = spline_segments(path_splines)
+        seg_len = np.hypot(*(p1 - p0).T) if len(p0) else np.zeros(0)
+
+        if cell_size is None:
+            cell_size = max(np.median(seg_len), 1e-3) if len(seg_len) else 1.0
+        self.cell_size = cell_size
+
+        p0, p1, parent, t0 = split_long_segments(p0, p1, 2.0 * cell_size)
+        spline_ids = spline_ids[parent]
+        s0 = s0[parent] + t0 * seg_len[parent]
+        seg_vec = p1 - p0
+        seg_len = np.hypot(seg_vec[:, 0], seg_vec[:, 1])
+        self.max_half_len = 0.5 * seg_len.max() if len(seg_len) else 0.0
+
+        mid = 0.5 * (p0 + p1)
+        cells = np.floor(mid / cell_size).astype(np.int64)
+        keys = self._cell_keys(cells[:, 0], cells[:, 1])
+        order = np.argsort(keys, kind='stable')
+
+        self.keys = keys[order]
+        self.p0 = p0[order]
+        self.seg_vec = seg_vec[order]
+        self.seg_len_sq = np.maximum(seg_len[order] ** 2, 1e-18)
+        self.seg_len = seg_len[order]
+        self.spline_ids = spline_ids[order]
+        self.s0 = s0[order]
+
+    @staticmethod
+    def _cell_keys(cell_x, cell_y):
+        # One sortable key, ordered by x and then y, for cells within +-2^31
+        return (cell_x.astype(np.int64) << 32) + (cell_y.astype(np.int64) + (1 << 31))
+
+    def _segments_near(self, x, y, radius):
+        reach = radius + self.max_half_len
+        cx = np.arange(np.floor((x - reach) / self.cell_size), np.floor((x + reach) / self.cell_size) + 1)
+        cy_lo = np.full(len(cx), np.floor((y - reach) / self.cell_size))
+        cy_hi = np.full(len(cx), np.floor((y + reach) / self.cell_size))
+
+        # Cells of one column with consecutive y are one contiguous key range
+        starts = np.searchsorted(self.keys, self._cell_keys(cx, cy_lo), side='left')
+        counts = np.searchsorted(self.keys, self._cell_keys(cx, cy_hi), side='right') - starts
+        return np.repeat(starts, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    def nearest(self, x, y, max_distance=5.0):
+        """
+        Nearest spline to a point
+
+        :param max_distance: search radius, bounds the number of cells visited
+        :return: SplineQuery with the spline index and arc length of the
+            closest point, or None if no spline is within max_distance
+        """
+        idx = self._segments_near(x, y, max_distance)
+        if len(idx) == 0:
+            return None
+
+        dx = x - self.p0[idx, 0]
+        dy = y - self.p0[idx, 1]
+        vx = self.seg_vec[idx, 0]
+        vy = self.seg_vec[idx, 1]
+        t = np.clip((dx * vx + dy * vy) / self.seg_len_sq[idx], 0.0, 1.0)
+        dist = np.hypot(dx - t * vx, dy - t * vy)
+
+        best = np.argmin(dist)
+        if dist[best] > max_distance:
+            return None
+
+        seg = idx[best]
+        return SplineQuery(spline=int(self.spline_ids[seg]),
+                           s=float(self.s0[seg] + t[best] * self.seg_len[seg]),
+                           distance=float(dist[best]),
+                           x=float(self.p0[seg, 0] + t[best] * vx[best]),
+                           y=float(self.p0[seg, 1] + t[best] * vy[best]))
+
+
+def test_spline_segment_index(num_queries=200, max_distance=2.0):
+    print("Spline segment index test")
+    from mapping.map_generator import PathSpline
+    rng = np.random.RandomState(0)
+
+    path_splines = []
+    for i in range(50):
+        walk = np.cumsum(rng.normal(scale=0.2, size=(200, 2)), axis=0) + rng.uniform(-20, 20, size=2)
+        path_splines.append(PathSpline(start_cell=(i, 0), x=walk[:, 0], y=walk[:, 1]))
+    # One long segment, which used to widen the search of every query
+    path_splines.append(PathSpline(start_cell=(50, 0), x=np.array([-250.0, 250.0]), y=np.array([-240.0, 260.0])))
+
+    index = SplineSegmentIndex(path_splines)
+    assert index.max_half_len <= index.cell_size, "Long segments were not split"
+
+    # Brute force nearest segment for points near and away from the splines
+    p0, p1, spline_ids, seg_ids, s0 = spline_segments(path_splines)
+    seg_vec = p1 - p0
+    seg_len = np.hypot(seg_vec[:, 0], seg_vec[:, 1])
+    queries = np.vstack([p0[rng.randint(len(p0), size=num_queries)] + rng.normal(size=(num_queries, 2)),
+                         rng.uniform(-30, 30, size=(num_queries, 2))])
+
+    for x, y in queries:
+        d = np.array([x, y]) - p0
+        t = np.clip((d * seg_vec).sum(axis=1) / np.maximum(seg_len ** 2, 1e-18), 0.0, 1.0)
+        dist = np.hypot(*(d - t[:, None] * seg_vec).T)
+        best = np.argmin(dist)
+
+        result = index.nearest(x, y, max_distance=max_distance)
+        if dist[best] > max_distance:
+            assert result is None, "Found a spline beyond max_distance at ({}, {})".format(x, y)
+            continue
+        assert result is not None, "Missed spline {} at ({}, {})".format(spline_ids[best], x, y)
+        assert abs(result.distance - dist[best]) < 1e-9, "Wrong distance at ({}, {})".format(x, y)
+        if result.spline == spline_ids[best]:
+            assert abs(result.s - (s0[best] + t[best] * seg_len[best])) < 1e-6, "Wrong arc length at ({}, {})".format(x, y)
+
+    print("All {} queries match".format(len(queries)))
+
+
+if __name__ == '__main__':
+    test_spline_segment_index()
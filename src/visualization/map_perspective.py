@@ -16,10 +16,21 @@ import math
 
 import time
 
+from mapping.spline_index import SplineSegmentIndex
+from visualization.picking import perspective_matrix, rotation_matrix, unproject_ray, intersect_ground
+
 WINDOW_TITLE = "Map Perspective Visualizer"
 WINDOW_WIDTH = 1920 
 WINDOW_HEIGHT = 1080
 
+FOV_Y = 45
+Z_NEAR = 0.1
+Z_FAR = 50.0
+
+# Height at which the path splines are drawn
+SPLINE_Z = -1.75
+PICK_MAX_DISTANCE = 5.0
+
 PATH_COLORS = [
     "#FFF0F5",
     "#FFD700",
@@ -99,7 +110,8 @@ class MapPerspective(object):
         self.sphere = gluNewQuadric() 
         
         glMatrixMode(GL_PROJECTION)
-        gluPerspective(45, (display[0]/display[1]), 0.1, 50.0)
+        gluPerspective(FOV_Y, (display[0]/display[1]), Z_NEAR, Z_FAR)
+        self.projection_matrix = perspective_matrix(FOV_Y, (display[0]/display[1]), Z_NEAR, Z_FAR)
         
         glMatrixMode(GL_MODELVIEW)
         gluLookAt(0, -8, 0, 0, 0, 0, 0, 0, 1)
@@ -114,6 +126,7 @@ class MapPerspective(object):
         # Get path splines
         self.nearby_splines = self.map_manager.get_nearby_splines(location=None)
         self.spline_colors = [random_color() for _ in self.nearby_splines]
+        self.spline_index = SplineSegmentIndex(self.nearby_splines)
 
         # init mouse movement and center mouse on screen
         self.up_down_angle = 0.0
@@ -185,7 +198,7 @@ class MapPerspective(object):
         glPushMatrix()
 
         # Rander path splines
-        glTranslatef(0, 0, -1.75)
+        glTranslatef(0, 0, SPLINE_Z)
         for spline_idx, spline in enumerate(self.nearby_splines):
             r, g, b = self.spline_colors[spline_idx] 
             glColor4f(r, g, b, 1)
@@ -214,6 +227,24 @@ class MapPerspective(object):
         
         pygame.display.flip()
 
+    def pick(self, mouse_pos, max_distance=PICK_MAX_DISTANCE):
+        """
+        Nearest spline under a window position
+
+        :return: SplineQuery with an index into nearby_splines and the arc
+            length of the picked point, or None if nothing is close enough
+        """
+        # Same model view as set up at the start of render
+        modelview = np.dot(rotation_matrix(self.up_down_angle, 1.0, 0.0, 0.0), np.asarray(self.viewMatrix).T)
+        width, height = self.screen.get_size()
+        origin, direction = unproject_ray(mouse_pos[0], mouse_pos[1], width, height, modelview, self.projection_matrix)
+
+        ground = intersect_ground(origin, direction, SPLINE_Z)
+        if ground is None:
+            return None
+
+        return self.spline_index.nearest(ground[0], ground[1], max_distance=max_distance)
+
     def handle_input_event(self, event):
         if event.type == pygame.QUIT:
             self.running = False
@@ -223,6 +254,10 @@ class MapPerspective(object):
             if event.key == pygame.K_PAUSE or event.key == pygame.K_p:
                 self.paused = not self.paused
                 pygame.mouse.set_pos(self.displayCenter) 
+        if event.type == pygame.MOUSEBUTTONDOWN:
+            picked = self.pick(event.pos)
+            if picked is not None:
+                print("Picked spline {} at s = {:.2f} ({:.2f}, {:.2f})".format(picked.spline, picked.s, picked.x, picked.y))
         if not self.paused: 
             if event.type == pygame.MOUSEMOTION:
                 self.mouseMove = [event.pos[i] - self.displayCenter[i] for i in range(2)]
@@ -0,0 +1,62 @@
+import math
+
+import numpy as np
+
+
+def perspective_matrix(fovy, aspect, z_near, z_far):
+    """ Projection matrix built by gluPerspective, fovy in degrees. """
+    f = 1.0 / math.tan(math.radians(fovy) / 2.0)
+    return np.array([
+        [f / aspect, 0.0, 0.0, 0.0],
+        [0.0, f, 0.0, 0.0],
+        [0.0, 0.0, (z_far + z_near) / (z_near - z_far), 2.0 * z_far * z_near / (z_near - z_far)],
+        [0.0, 0.0, -1.0, 0.0],
+    ])
+
+
+def rotation_matrix(angle, x, y, z):
+    """ Rotation matrix built by glRotatef, angle in degrees. """
+    axis = np.array([x, y, z], dtype=float)
+    axis /= np.linalg.norm(axis)
+    x, y, z = axis
+    c = math.cos(math.radians(angle))
+    s = math.sin(math.radians(angle))
+    rotation = np.identity(4)
+    rotation[:3, :3] = [
+        [x * x * (1 - c) + c, x * y * (1 - c) - z * s, x * z * (1 - c) + y * s],
+        [y * x * (1 - c) + z * s, y * y * (1 - c) + c, y * z * (1 - c) - x * s],
+        [x * z * (1 - c) - y * s, y * z * (1 - c) + x * s, z * z * (1 - c) + c],
+    ]
+    return rotation
+
+
+def unproject_ray(mouse_x, mouse_y, width, height, modelview, projection):
+    """
+    World space ray through a window position
+
+    Matrices are in row-major math convention, i.e. the transpose of what
+    glGetFloatv returns.
+
+    :return: origin on the near plane and direction towards the far plane
+    """
+    ndc_x = 2.0 * mouse_x / width - 1.0
+    # Window y grows downwards
+    ndc_y = 1.0 - 2.0 * mouse_y / height
+
+    inverse = np.linalg.inv(np.dot(projection, modelview))
+    near = np.dot(inverse, [ndc_x, ndc_y, -1.0, 1.0])
+    far = np.dot(inverse, [ndc_x, ndc_y, 1.0, 1.0])
+    near = near[:3] / near[3]
+    far = far[:3] / far[3]
+
+    return near, far - near
+
+
+def intersect_ground(origin, direction, z):
+    """ Point where the ray crosses the plane at height z, or None if it never does. """
+    if abs(direction[2]) < 1e-12:
+        return None
+    t = (z - origin[2]) / direction[2]
+    if t < 0.0:
+        return None
+    return origin + t * direction